@@ -14,6 +14,10 @@ class Settings(BaseSettings):
     MONGO_DB_NAME: str = "omnistatus"
     MONGO_COLL_NAME: str = "events"
     MONGO_COLL_VICTORIA: str = "victoria_history"
+    # Write-behind for POST /event: queue and flush with insert_many
+    EVENT_WRITE_BEHIND: int = 0
+    EVENT_FLUSH_SIZE: int = 500
+    EVENT_FLUSH_MS: int = 50
 
     # Analysis
     SYSTEM_PROMPT: str = (
@@ -23,6 +27,8 @@ class Settings(BaseSettings):
         "Do not include anything outside the JSON object."
     )
     PROMPT_ANALYSIS: str = "Analyze events and return JSON {\"score\":float,\"text\":string}."
+    ANALYZE_BATCH_SIZE: int = 500
+    ANALYZE_CONCURRENCY: int = 4
     
     # Alerts
     ALERT_SCORE_THRESHOLD: float = 0.5
@@ -5,7 +5,7 @@ class Database:
     client: AsyncIOMotorClient = None
 
     def connect(self):
-        self.client = AsyncIOMotorClient(settings.MONGO_URI)
+        self.client = AsyncIOMotorClient(settings.MONGO_URI, tz_aware=True)
         print(f"✅ Connected to MongoDB at {settings.MONGO_URI}")
 
     def close(self):
@@ -26,3 +26,25 @@ def get_event_collection():
 
 def get_victoria_collection():
     return db.get_collection(settings.MONGO_COLL_VICTORIA)
+
+# Collections whose timestamp index is known to exist; hinting a missing index
+# fails the query outright, so callers only hint these
+_timestamp_indexed = set()
+
+def timestamp_hint(coll):
+    return [("timestamp", -1)] if coll.name in _timestamp_indexed else None
+
+async def ensure_indexes():
+    # Descending timestamp serves the newest-first list endpoints; the compound
+    # index covers source-filtered lists without an in-memory sort; the text
+    # index backs the `text` search filter.
+    for coll in (get_event_collection(), get_victoria_collection()):
+        try:
+            await coll.create_index([("timestamp", -1)])
+            _timestamp_indexed.add(coll.name)
+            await coll.create_index([("source", 1), ("timestamp", -1)])
+            await coll.create_index(
+                [("text", "text"), ("description", "text")], name="events_text_idx"
+            )
+        except Exception as e:
+            print(f"⚠ Error creating indexes on {coll.name}: {e}")
@@ -1,15 +1,101 @@
+import re
+import time
+import asyncio
 import datetime as dt
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from statistics import fmean
 from typing import Optional, List
-from fastapi import FastAPI, Query
+import ciso8601
+import orjson
+from cachetools import TTLCache
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response
+from pymongo.errors import BulkWriteError, OperationFailure
 
 from app.config import settings
-from app.database import db, get_event_collection, get_victoria_collection
+from app.database import db, ensure_indexes, get_event_collection, get_victoria_collection, timestamp_hint
 from app.models import Event
-from app.services.llm import openai_analyze_events
+from app.services.llm import close_client, openai_analyze_batched
 
 # ===== App =====
-app = FastAPI(title=settings.APP_NAME)
+# Set while write-behind is enabled; /event then enqueues instead of inserting
+_insert_queue: Optional[asyncio.Queue] = None
+
+async def event_writer(queue: asyncio.Queue):
+    """Coalesces queued /event documents into unordered insert_many calls."""
+    loop = asyncio.get_running_loop()
+    stop = False
+    while not stop:
+        doc = await queue.get()
+        if doc is None:
+            break
+        docs = [doc]
+        deadline = loop.time() + settings.EVENT_FLUSH_MS / 1000
+        while len(docs) < settings.EVENT_FLUSH_SIZE:
+            # Not wait_for: on 3.11 a timeout racing a completed get() drops the
+            # item. A get() cancelled while still waiting never dequeues one.
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=max(0.0, deadline - loop.time()))
+            if getter not in done:
+                getter.cancel()
+                break
+            doc = getter.result()
+            if doc is None:
+                stop = True
+                break
+            docs.append(doc)
+        await insert_queued(docs)
+
+QUEUED_INSERT_ATTEMPTS = 5
+
+async def insert_queued(docs: List[dict]):
+    """insert_many with backoff for already-acknowledged ("queued") events.
+
+    _ids are assigned on the first attempt, so a retry after a partial write
+    only gets duplicate-key errors for the documents that already landed.
+    While this retries the writer is blocked, so the bounded queue pushes back
+    on /event callers instead of growing.
+    """
+    for attempt in range(QUEUED_INSERT_ATTEMPTS):
+        try:
+            await get_event_collection().insert_many(docs, ordered=False)
+            return
+        except BulkWriteError as e:
+            failed = {w["index"] for w in e.details.get("writeErrors", []) if w.get("code") != 11000}
+            if not failed:
+                return
+            docs = [d for i, d in enumerate(docs) if i in failed]
+            err = e
+        except Exception as e:
+            err = e
+        print(f"⚠ Error saving queued events (attempt {attempt + 1}/{QUEUED_INSERT_ATTEMPTS}): {err}")
+        if attempt + 1 < QUEUED_INSERT_ATTEMPTS:
+            await asyncio.sleep(min(2 ** attempt, 30))
+    print(f"⚠ Dropped {len(docs)} queued events after {QUEUED_INSERT_ATTEMPTS} failed writes")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _insert_queue
+    db.connect()
+    await ensure_indexes()
+    refresher = asyncio.create_task(summary_refresher())
+    writer = None
+    if settings.EVENT_WRITE_BEHIND:
+        # Bounded so producers wait instead of piling up memory if Mongo lags
+        _insert_queue = asyncio.Queue(maxsize=settings.EVENT_FLUSH_SIZE * 20)
+        writer = asyncio.create_task(event_writer(_insert_queue))
+    yield
+    refresher.cancel()
+    if writer:
+        await _insert_queue.put(None)  # flush what is queued, then stop
+        await writer
+        _insert_queue = None
+    db.close()
+    await close_client()
+
+app = FastAPI(title=settings.APP_NAME, default_response_class=ORJSONResponse, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,116 +105,215 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.on_event("startup")
-async def startup_db_client():
-    db.connect()
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    db.close()
-
 # ===== Utils =====
+SCORE_KEYS = ("score", "value", "valor", "promedio")
+TEXT_KEYS = ("text", "texto", "description", "msg")
+# Fields each read path actually uses; skips wide payloads on the wire
+EVENT_PROJECTION = {"timestamp": 1, "source": 1, **{k: 1 for k in SCORE_KEYS + TEXT_KEYS}}
+ANALYZE_PROJECTION = {"_id": 0, "timestamp": 1, "source": 1, "text": 1, "score": 1}
+SUMMARY_PROJECTION = {"_id": 0, "timestamp": 1, **{k: 1 for k in SCORE_KEYS + TEXT_KEYS}}
+
 def now_iso() -> str:
     return dt.datetime.utcnow().isoformat()
 
-def parse_iso_dt(value: str) -> Optional[str]:
-    """Parses flexible ISO8601 dates and returns normalized ISO string."""
+def to_datetime(value) -> Optional[dt.datetime]:
+    """Coerces a datetime or ISO8601 string to an aware UTC datetime."""
+    if isinstance(value, dt.datetime):
+        if value.tzinfo is None:
+            return value.replace(tzinfo=dt.timezone.utc)
+        return value.astimezone(dt.timezone.utc)
+    if isinstance(value, str):
+        return parse_iso_dt(value)
+    return None
+
+def parse_iso_dt(value: str) -> Optional[dt.datetime]:
+    """Parses flexible ISO8601 dates and returns normalized UTC datetime."""
     try:
-        parsed = dt.datetime.fromisoformat(value.replace("Z", "+00:00"))
-        # Save in UTC if timestamp comes with tzinfo
-        if parsed.tzinfo:
-            parsed = parsed.astimezone(dt.timezone.utc).replace(tzinfo=None)
-        return parsed.isoformat()
+        parsed = ciso8601.parse_datetime(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=dt.timezone.utc)
+        else:
+            parsed = parsed.astimezone(dt.timezone.utc)
+        return parsed
     except Exception:
         return None
 
-def serialize_event(doc: dict) -> dict:
-    data = dict(doc)
-    if "_id" in data:
-        data["_id"] = str(data["_id"])
-    return data
-
 def extract_score(ev: dict) -> Optional[float]:
-    for key in ("score", "value", "valor", "promedio"):
+    for key in SCORE_KEYS:
         val = ev.get(key)
         if isinstance(val, (int, float)):
             return float(val)
     return None
 
 async def load_events(hours: int) -> List[dict]:
-    cutoff = dt.datetime.utcnow() - dt.timedelta(hours=max(1, hours))
+    cutoff = dt.datetime.now(dt.timezone.utc) - dt.timedelta(hours=max(1, hours))
     try:
         coll = get_event_collection()
-        cursor = coll.find({"timestamp": {"$gte": cutoff.isoformat()}})
-        return [serialize_event(doc) async for doc in cursor]
+        # Chronological via the timestamp index; a stable order also keeps the
+        # analysis cache key stable for an unchanged window
+        cursor = coll.find(
+            {"timestamp": {"$gte": cutoff}},
+            projection=ANALYZE_PROJECTION,
+            sort=[("timestamp", 1)],
+            hint=timestamp_hint(coll),
+        ).batch_size(1000)
+        # Projected docs have no _id, and the prompt renders datetimes as-is,
+        # so there is nothing to serialize per document
+        return await cursor.to_list(length=None)
     except Exception as e:
         print(f"⚠ Error loading events: {e}")
         return []
 
+def first_text_expr():
+    """First non-empty TEXT_KEYS field, or null (like `if ev.get(k)` in Python).
+
+    $ifNull alone would let an empty string win; a missing field is wrapped in
+    $ifNull first because it does not compare equal to null in expressions.
+    """
+    expr = None
+    for k in reversed(TEXT_KEYS):
+        expr = {"$cond": [{"$in": [{"$ifNull": [f"${k}", None]}, [None, ""]]}, expr, f"${k}"]}
+    return expr
+
+def summary_pipeline(mode: str, limit_buckets: int) -> List[dict]:
+    """Aggregation that buckets the latest 5000 events by 3h period or day."""
+    unit, bin_size = ("hour", 3) if mode == "3h" else ("day", 1)
+    return [
+        {"$sort": {"timestamp": -1}},
+        {"$limit": 5000},
+        {
+            "$project": {
+                "ts": {"$convert": {"input": "$timestamp", "to": "date", "onError": None, "onNull": None}},
+                "score": {
+                    "$switch": {
+                        "branches": [{"case": {"$isNumber": f"${k}"}, "then": f"${k}"} for k in SCORE_KEYS],
+                        "default": None,
+                    }
+                },
+                "text": first_text_expr(),
+            }
+        },
+        {"$match": {"ts": {"$ne": None}}},
+        {
+            "$group": {
+                "_id": {"$dateTrunc": {"date": "$ts", "unit": unit, "binSize": bin_size}},
+                "count": {"$sum": 1},
+                "avg_score": {"$avg": "$score"},
+                "texts": {"$push": "$text"},
+            }
+        },
+        {
+            "$project": {
+                "count": 1,
+                "avg_score": 1,
+                "texts": {"$slice": [{"$filter": {"input": "$texts", "cond": {"$not": [{"$in": ["$$this", [None, ""]]}]}}}, 3]},
+            }
+        },
+        {"$sort": {"_id": -1}},
+        {"$limit": limit_buckets},
+    ]
+
+def summary_entry(mode: str, row: dict) -> dict:
+    start = to_datetime(row["_id"]).replace(tzinfo=None)
+    texts = [str(t) for t in row["texts"]]
+    entry = {
+        "text": " | ".join(texts) if texts else "No samples",
+        "score": row["avg_score"] if row["avg_score"] is not None else "—",
+        "hash": f"{row['count']} evts",
+        "tipo": "3h" if mode == "3h" else "dia",
+    }
+    if mode == "3h":
+        entry["period"] = start.isoformat() + "Z"
+    else:
+        entry["date"] = start.date().isoformat()
+    return entry
+
 async def summarize_collection(target_coll, mode: str, limit_buckets: int = 200) -> List[dict]:
     try:
-        # Motor cursor needs async iteration or to_list
-        cursor = target_coll.find({}, sort=[("timestamp", -1)], projection={"_id": 0}).limit(5000)
-        raw = await cursor.to_list(length=5000)
+        cursor = target_coll.aggregate(summary_pipeline(mode, limit_buckets))
+        rows = await cursor.to_list(length=limit_buckets)
+        return [summary_entry(mode, row) for row in rows]
+    except OperationFailure as e:
+        # $dateTrunc needs MongoDB 5.0+; older servers are bucketed in Python
+        print(f"⚠ Summary aggregation failed, bucketing in Python: {e}")
+    except Exception as e:
+        print(f"⚠ Error reading events: {e}")
+        return []
+
+    try:
+        # Fetch in bulk batches rather than one event-loop hop per document
+        cursor = target_coll.find({}, sort=[("timestamp", -1)], projection=SUMMARY_PROJECTION).limit(5000)
+        raw = await cursor.batch_size(1000).to_list(length=5000)
     except Exception as e:
         print(f"⚠ Error reading events: {e}")
         return []
+    return bucket_events(raw, mode, limit_buckets)
 
-    buckets = {}
+def bucket_events(raw: List[dict], mode: str, limit_buckets: int) -> List[dict]:
+    # Buckets are keyed by their start in epoch seconds; dates are only
+    # formatted once per bucket, not per event
+    span = 3 * 3600 if mode == "3h" else 86400
+    buckets = defaultdict(lambda: {"count": 0, "scores": [], "texts": []})
     for ev in raw:
-        ts = ev.get("timestamp")
-        if not ts:
+        d = to_datetime(ev.get("timestamp"))
+        if not d:
             continue
-        try:
-            d = dt.datetime.fromisoformat(str(ts).replace("Z", "+00:00"))
-        except Exception:
-            continue
-
-        if mode == "3h":
-            d = d.replace(minute=0, second=0, microsecond=0)
-            bucket_hour = (d.hour // 3) * 3
-            start = d.replace(hour=bucket_hour)
-            key = start.isoformat() + "Z"
-            bucket = buckets.setdefault(
-                key,
-                {"period": key, "tipo": "3h", "count": 0, "scores": [], "texts": []},
-            )
-        else:
-            date_key = d.date().isoformat()
-            bucket = buckets.setdefault(
-                date_key,
-                {"date": date_key, "tipo": "dia", "count": 0, "scores": [], "texts": []},
-            )
+        bucket = buckets[int(d.timestamp()) // span * span]
 
         bucket["count"] += 1
         sc = extract_score(ev)
         if sc is not None:
             bucket["scores"].append(sc)
         if len(bucket["texts"]) < 3:
-            txt = ev.get("text") or ev.get("texto") or ev.get("description") or ev.get("msg")
+            txt = next((ev[k] for k in TEXT_KEYS if ev.get(k)), None)
             if txt:
                 bucket["texts"].append(str(txt))
 
     items = []
-    for _, data in buckets.items():
-        avg = sum(data["scores"]) / len(data["scores"]) if data["scores"] else None
+    for key in sorted(buckets, reverse=True)[:limit_buckets]:
+        data = buckets[key]
+        avg = fmean(data["scores"]) if data["scores"] else None
+        start = dt.datetime.fromtimestamp(key, dt.timezone.utc).replace(tzinfo=None)
         entry = {
             "text": " | ".join(data["texts"]) if data["texts"] else "No samples",
             "score": avg if avg is not None else "—",
             "hash": f"{data['count']} evts",
-            "tipo": data["tipo"],
         }
         if mode == "3h":
-            entry["period"] = data["period"]
+            entry["tipo"] = "3h"
+            entry["period"] = start.isoformat() + "Z"
         else:
-            entry["date"] = data["date"]
+            entry["tipo"] = "dia"
+            entry["date"] = start.date().isoformat()
         items.append(entry)
-
-    sort_key = "period" if mode == "3h" else "date"
-    items.sort(key=lambda x: x.get(sort_key, ""), reverse=True)
+    return items
+
+# Summaries change slowly; a background task refreshes one snapshot per
+# collection/mode and every poll is served from it
+SUMMARY_MAX_BUCKETS = 1000  # the endpoints' limit cap
+SUMMARY_REFRESH_SECONDS = 30
+_SUMMARY_CACHE = TTLCache(maxsize=16, ttl=SUMMARY_REFRESH_SECONDS * 2)
+
+async def refresh_summary(target_coll, mode: str) -> List[dict]:
+    items = await summarize_collection(target_coll, mode, SUMMARY_MAX_BUCKETS)
+    if items:  # read errors come back empty; don't pin them for the TTL
+        _SUMMARY_CACHE[(target_coll.name, mode)] = items
+    return items
+
+async def summary_refresher():
+    while True:
+        for coll in (get_event_collection(), get_victoria_collection()):
+            for mode in ("3h", "day"):
+                await refresh_summary(coll, mode)
+        await asyncio.sleep(SUMMARY_REFRESH_SECONDS)
+
+async def cached_summarize(target_coll, mode: str, limit_buckets: int) -> List[dict]:
+    items = _SUMMARY_CACHE.get((target_coll.name, mode))
+    if items is None:
+        items = await refresh_summary(target_coll, mode)
+    # Buckets are newest first, so any smaller limit is a prefix of the snapshot
     return items[:limit_buckets]
 
-
 async def query_collection(
     target_coll,
     start: Optional[str],
@@ -136,50 +321,109 @@ async def query_collection(
     source: Optional[str],
     text: Optional[str],
     limit: int,
+    external: bool = False,
 ):
+    # external: the collection is written outside this repo (victoria_history),
+    # so timestamps may still be ISO strings and sources mixed case
     mongo_filter = {}
 
     ts_filter = {}
+    ts_filter_str = {}
     if start:
-        start_iso = parse_iso_dt(start)
-        if not start_iso:
+        start_dt = parse_iso_dt(start)
+        if not start_dt:
             return {"count": 0, "items": [], "error": "invalid start (ISO8601)"}
-        ts_filter["$gte"] = start_iso
+        ts_filter["$gte"] = start_dt
+        ts_filter_str["$gte"] = start_dt.isoformat()
     if end:
-        end_iso = parse_iso_dt(end)
-        if not end_iso:
+        end_dt = parse_iso_dt(end)
+        if not end_dt:
             return {"count": 0, "items": [], "error": "invalid end (ISO8601)"}
-        ts_filter["$lte"] = end_iso
-    if ts_filter:
+        ts_filter["$lte"] = end_dt
+        ts_filter_str["$lte"] = end_dt.isoformat()
+    if ts_filter and external:
+        mongo_filter["$or"] = [{"timestamp": ts_filter}, {"timestamp": ts_filter_str}]
+    elif ts_filter:
         mongo_filter["timestamp"] = ts_filter
 
-    if source:
-        mongo_filter["source"] = {"$regex": source, "$options": "i"}
+    if source and external:
+        # Sources there keep their original case
+        mongo_filter["source"] = {"$regex": f"^{re.escape(source)}", "$options": "i"}
+    elif source:
+        # Anchored, case-sensitive prefix on the lowercased field is index-eligible
+        mongo_filter["source"] = {"$regex": f"^{re.escape(source.lower())}"}
 
     if text:
-        mongo_filter["$or"] = [
-            {"text": {"$regex": text, "$options": "i"}},
-            {"description": {"$regex": text, "$options": "i"}},
-        ]
+        mongo_filter["$text"] = {"$search": text}
+
+    # Without a source filter, walk the timestamp index so sort + limit stream
+    # from it ($text queries pick the text index and cannot take a hint)
+    hint = None if source or text else timestamp_hint(target_coll)
 
     try:
-        cursor = target_coll.find(mongo_filter, sort=[("timestamp", -1)]).limit(limit)
-        events = [serialize_event(e) async for e in cursor]
+        cursor = target_coll.find(
+            mongo_filter, projection=EVENT_PROJECTION, sort=[("timestamp", -1)], hint=hint
+        ).limit(limit)
+        events = await cursor.batch_size(limit).to_list(length=limit)
+        # The response class encodes the (UTC) dates; ObjectId needs a string
+        for e in events:
+            e["_id"] = str(e["_id"])
         return {"count": len(events), "items": events, "applied_filter": mongo_filter}
     except Exception as e:
         return {"count": 0, "items": [], "error": str(e), "applied_filter": mongo_filter}
 
 # ===== Endpoints =====
+# Load balancers probe /health constantly; rebuild the body at most every 250ms
+_health_body = b""
+_health_until = 0.0
+
 @app.get("/health")
 async def health():
-    return {"ok": True, "ts": now_iso()}
+    global _health_body, _health_until
+    now = time.monotonic()
+    if now >= _health_until:
+        _health_body = orjson.dumps({"ok": True, "ts": now_iso()})
+        _health_until = now + 0.25
+    return Response(_health_body, media_type="application/json")
+
+def event_doc(ev: Event) -> Optional[dict]:
+    """Storage document for an event, or None if its timestamp is not ISO8601."""
+    data = ev.model_dump()  # Pydantic v2
+    data["source"] = data["source"].lower()
+    # Always store a BSON date so range queries hit a single index type; a
+    # missing timestamp means "now", an unparseable one is rejected rather
+    # than re-dated into the current analysis window
+    if data.get("timestamp") is None:
+        data["timestamp"] = dt.datetime.now(dt.timezone.utc)
+    else:
+        data["timestamp"] = to_datetime(data["timestamp"])
+        if not data["timestamp"]:
+            return None
+    return data
+
+def bulk_event_docs(evs: List[Event]):
+    """Documents for the valid events, plus the list indexes of rejected ones."""
+    docs, rejected = [], []
+    for i, ev in enumerate(evs):
+        data = event_doc(ev)
+        if data is None:
+            rejected.append(i)
+        else:
+            docs.append(data)
+    return docs, rejected
+
+def valid_event_doc(ev: Event) -> dict:
+    data = event_doc(ev)
+    if data is None:
+        raise HTTPException(status_code=422, detail=f"invalid timestamp (ISO8601): {ev.timestamp}")
+    return data
 
 @app.post("/event")
 async def add_event(ev: Event):
-    data = ev.model_dump() # Pydantic v2
-    if not data.get("timestamp"):
-        data["timestamp"] = now_iso()
-    
+    data = valid_event_doc(ev)
+    if _insert_queue is not None:
+        await _insert_queue.put(data)
+        return {"status": "queued"}
     try:
         await get_event_collection().insert_one(data)
         return {"status": "stored"}
@@ -187,6 +431,23 @@ async def add_event(ev: Event):
         print(f"⚠ Error saving event: {e}")
         return {"status": "error", "message": str(e)}
 
+@app.post("/events:bulk")
+@app.post("/events:batch")
+async def add_events(evs: List[Event]):
+    docs, rejected = bulk_event_docs(evs)
+    if not docs:
+        return {"status": "partial" if rejected else "stored", "count": 0, "rejected": rejected}
+    try:
+        # Unordered: one round trip, and a bad document doesn't stop the rest
+        res = await get_event_collection().insert_many(docs, ordered=False)
+        return {"status": "partial" if rejected else "stored", "count": len(res.inserted_ids), "rejected": rejected}
+    except BulkWriteError as e:
+        print(f"⚠ Error saving events: {e}")
+        return {"status": "partial", "count": e.details.get("nInserted", 0), "rejected": rejected, "message": str(e)}
+    except Exception as e:
+        print(f"⚠ Error saving events: {e}")
+        return {"status": "error", "message": str(e)}
+
 @app.get("/events")
 async def list_events(
     start: Optional[str] = None,
@@ -200,13 +461,13 @@ async def list_events(
 
 @app.get("/events/summary/3h")
 async def summary_3h(limit: int = Query(200, ge=1, le=1000)):
-    items = await summarize_collection(get_event_collection(), mode="3h", limit_buckets=limit)
+    items = await cached_summarize(get_event_collection(), mode="3h", limit_buckets=limit)
     return {"count": len(items), "items": items}
 
 
 @app.get("/events/summary/day")
 async def summary_day(limit: int = Query(200, ge=1, le=1000)):
-    items = await summarize_collection(get_event_collection(), mode="day", limit_buckets=limit)
+    items = await cached_summarize(get_event_collection(), mode="day", limit_buckets=limit)
     return {"count": len(items), "items": items}
 
 
@@ -218,22 +479,39 @@ async def victoria_history(
     text: Optional[str] = None,
     limit: int = Query(200, ge=1, le=1000),
 ):
-    return await query_collection(get_victoria_collection(), start, end, source, text, limit)
+    return await query_collection(
+        get_victoria_collection(), start, end, source, text, limit, external=True
+    )
 
 
 @app.get("/victoria/history/summary/3h")
 async def victoria_summary_3h(limit: int = Query(200, ge=1, le=1000)):
-    items = await summarize_collection(get_victoria_collection(), mode="3h", limit_buckets=limit)
+    items = await cached_summarize(get_victoria_collection(), mode="3h", limit_buckets=limit)
     return {"count": len(items), "items": items}
 
 
 @app.get("/victoria/history/summary/day")
 async def victoria_summary_day(limit: int = Query(200, ge=1, le=1000)):
-    items = await summarize_collection(get_victoria_collection(), mode="day", limit_buckets=limit)
+    items = await cached_summarize(get_victoria_collection(), mode="day", limit_buckets=limit)
     return {"count": len(items), "items": items}
 
+# Dashboards poll /analyze; identical windows reuse the last result until a new event lands
+_ANALYZE_CACHE = TTLCache(maxsize=64, ttl=30)
+
+# Runs in progress per window; concurrent requests await the same one
+_ANALYZE_INFLIGHT: dict = {}
+
 @app.get("/analyze")
 async def analyze(hours: int = Query(1, ge=1, le=168)):
+    task = _ANALYZE_INFLIGHT.get(hours)
+    if task is None:
+        task = asyncio.create_task(run_analysis(hours))
+        _ANALYZE_INFLIGHT[hours] = task
+        task.add_done_callback(lambda _: _ANALYZE_INFLIGHT.pop(hours, None))
+    # Shielded so one client disconnecting doesn't cancel the others' result
+    return await asyncio.shield(task)
+
+async def run_analysis(hours: int) -> dict:
     events = await load_events(hours)
     if not events:
         return {
@@ -243,11 +521,16 @@ async def analyze(hours: int = Query(1, ge=1, le=168)):
             "events_count": 0,
             "window_hours": hours,
         }
-    res = await openai_analyze_events(events)
-    return {
+    key = (hours, events[-1].get("timestamp"), len(events))
+    if key in _ANALYZE_CACHE:
+        return _ANALYZE_CACHE[key]
+    res = await openai_analyze_batched(events)
+    out = {
         "status": "ok",
         "score": float(res.get("score", 0.0)),
         "msg": res.get("text", "No summary"),
         "events_count": len(events),
         "window_hours": hours,
     }
+    _ANALYZE_CACHE[key] = out
+    return out
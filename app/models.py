@@ -1,8 +1,28 @@
 from typing import Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 
 class Event(BaseModel):
     source: str
     text: str            # event description
     score: Optional[float] = None  # risk level
     timestamp: Optional[str] = None  # ISO8601 string
+
+class AnalysisResult(BaseModel):
+    score: float = 0.0   # risk level, clamped to [0, 1]
+    text: str = "No summary"
+
+    @field_validator("score", mode="before")
+    @classmethod
+    def default_score(cls, v):
+        return 0.0 if v is None else v
+
+    @field_validator("score")
+    @classmethod
+    def clamp_score(cls, v: float) -> float:
+        return max(0.0, min(v, 1.0))
+
+    @field_validator("text", mode="before")
+    @classmethod
+    def default_text(cls, v):
+        # The model sometimes answers with a number or list; keep it as text
+        return str(v) if v else "No summary"
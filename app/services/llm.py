@@ -1,54 +1,110 @@
-import json
+import io
 import re
+import asyncio
+import hashlib
 import httpx
+import orjson
 from typing import List, Dict, Any
+from cachetools import TTLCache
+from pydantic import ValidationError
 from app.config import settings
+from app.models import AnalysisResult
+
+# Settings are fixed for the process lifetime; bind them once for the hot path
+_API_KEY = settings.OPENAI_API_KEY
+_MODEL = settings.OPENAI_MODEL
+_SYS = settings.SYSTEM_PROMPT
+_PROMPT = settings.PROMPT_ANALYSIS
+_HEADERS = {"Authorization": f"Bearer {_API_KEY}", "Content-Type": "application/json"}
+_SYSTEM_MSG = {"role": "system", "content": _SYS}
+# Fallback for replies that wrap the JSON object in extra text
+_JSON_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+# Shared client so keep-alive connections (and TLS sessions) are reused across calls
+_client = httpx.AsyncClient(
+    base_url="https://api.openai.com",
+    http2=True,
+    # Fail fast on an unreachable host; completions themselves can take a while
+    timeout=httpx.Timeout(30.0, connect=5.0),
+    limits=httpx.Limits(max_keepalive_connections=20),
+    headers=_HEADERS,
+)
+
+# Analysis results keyed by a hash of the prompt; an unchanged event window
+# within one analysis interval is answered without calling OpenAI again
+_cache = TTLCache(maxsize=1024, ttl=settings.ANALYZE_INTERVAL)
+
+# Caps OpenAI calls in flight across all requests, not just within one batched run
+_sem = asyncio.Semaphore(settings.ANALYZE_CONCURRENCY)
+
+async def close_client():
+    await _client.aclose()
 
 async def openai_analyze_events(events: List[Dict[str, Any]]) -> Dict[str, Any]:
-    events_text = "\n".join(
-        f"[{e.get('timestamp')}] {e.get('source')}: {e.get('text')} (score={e.get('score')})"
-        for e in events
-    ) or "(no events)"
+    # One growing buffer instead of a temporary string per event line
+    buf = io.StringIO()
+    w = buf.write
+    w(_PROMPT)
+    w("\n\nEvents:")
+    if not events:
+        w("\n(no events)")
+    for e in events:
+        w("\n[")
+        w(str(e.get("timestamp")))
+        w("] ")
+        w(str(e.get("source")))
+        w(": ")
+        w(str(e.get("text")))
+        w(" (score=")
+        w(str(e.get("score")))
+        w(")")
+    user_msg = buf.getvalue()
 
-    system_msg = settings.SYSTEM_PROMPT
-    user_msg = f"{settings.PROMPT_ANALYSIS}\n\nEvents:\n{events_text}"
+    key = hashlib.blake2b(user_msg.encode(), digest_size=16).hexdigest()
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached
 
     payload = {
-        "model": settings.OPENAI_MODEL,
+        "model": _MODEL,
         "messages": [
-            {"role": "system", "content": system_msg},
+            _SYSTEM_MSG,
             {"role": "user", "content": user_msg},
         ],
         "temperature": 0,
         "response_format": {"type": "json_object"},
     }
-    
-    headers = {
-        "Authorization": f"Bearer {settings.OPENAI_API_KEY}",
-        "Content-Type": "application/json",
-    }
 
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            r = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers=headers,
-                json=payload
-            )
+        async with _sem:
+            r = await _client.post("/v1/chat/completions", content=orjson.dumps(payload))
 
         if r.status_code != 200:
             return {"score": 0.0, "text": f"OpenAI {r.status_code}: {r.text[:200]}"}
 
-        content = r.json()["choices"][0]["message"]["content"]
+        content = orjson.loads(r.content)["choices"][0]["message"]["content"]
         try:
-            parsed = json.loads(content)
-        except Exception:
-            m = re.search(r"\{.*\}", content, flags=re.DOTALL)
-            parsed = json.loads(m.group(0)) if m else {"score": 0.0, "text": "Parse error"}
+            parsed = AnalysisResult.model_validate_json(content)
+        except ValidationError:
+            m = _JSON_RE.search(content)
+            parsed = AnalysisResult.model_validate_json(m.group(0)) if m else AnalysisResult(text="Parse error")
 
-        score = float(parsed.get("score", 0.0))
-        text = parsed.get("text") or "No summary"
-        return {"score": max(0.0, min(score, 1.0)), "text": text}
+        result = parsed.model_dump()
+        _cache[key] = result
+        return result
 
     except Exception as e:
         return {"score": 0.0, "text": f"Analysis error: {e}"}
+
+async def openai_analyze_batched(events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Analyzes large windows as concurrent batches and keeps the highest risk."""
+    size = settings.ANALYZE_BATCH_SIZE
+    batches = [events[i:i + size] for i in range(0, len(events), size)]
+    if len(batches) <= 1:
+        return await openai_analyze_events(events)
+
+    results = await asyncio.gather(*(openai_analyze_events(b) for b in batches))
+    return {
+        "score": max(r["score"] for r in results),
+        "text": "\n\n".join(r["text"] for r in results),
+    }
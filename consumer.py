@@ -1,18 +1,29 @@
 import os
-import time
-import json
 import logging
-import random
-import requests
+import json
+import orjson
 import re
+from bisect import bisect_left, bisect_right
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone
-from difflib import SequenceMatcher
+from functools import lru_cache
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel
 
-from fastapi import FastAPI, HTTPException, Body
+import ciso8601
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pymongo import MongoClient
+from fastapi.responses import ORJSONResponse
+from motor.motor_asyncio import AsyncIOMotorClient
+from rapidfuzz import fuzz, process
+import httpx
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception_type,
+    retry_if_result,
+    stop_after_attempt,
+    wait_random_exponential,
+)
 import uvicorn
 
 from app.config import settings
@@ -21,6 +32,8 @@ from app.config import settings
 OPENAI_API_KEY = settings.OPENAI_API_KEY
 OPENAI_MODEL = settings.OPENAI_MODEL
 PROMPT_ANALYSIS = settings.PROMPT_ANALYSIS
+OPENAI_HEADERS = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
+SYSTEM_MSG = {"role": "system", "content": "You are an expert monitoring system. Respond in valid JSON."}
 
 MONGO_URI = settings.MONGO_URI
 MONGO_DB = settings.MONGO_DB_NAME
@@ -39,12 +52,30 @@ logging.basicConfig(
 )
 
 # ===== Database =====
-mongo_client = MongoClient(MONGO_URI)
+mongo_client = AsyncIOMotorClient(MONGO_URI)
 db = mongo_client[MONGO_DB]
 col = db[MONGO_COLLECTION]
 
+# ===== HTTP =====
+# Shared client keeps connections to OpenAI/Telegram alive between calls
+_http = httpx.AsyncClient(http2=True)
+
 # ===== FastAPI App =====
-app = FastAPI(title="OmniStatus Consumer API")
+_timestamp_indexed = False  # set once the startup index build succeeds
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _timestamp_indexed
+    try:
+        await col.create_index([("timestamp", -1)])
+        _timestamp_indexed = True
+    except Exception as e:
+        logging.warning(f"Could not create timestamp index: {e}")
+    yield
+    await _http.aclose()
+    mongo_client.close()
+
+app = FastAPI(title="OmniStatus Consumer API", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -83,77 +114,114 @@ class TelegramRequest(BaseModel):
 # =========================================================
 # 🔁 RETRIES (WITH EXPONENTIAL BACKOFF)
 # =========================================================
-def with_retries(request_fn, max_attempts=3, base_delay=1.0, max_delay=30.0):
-    attempt = 0
-    while True:
-        try:
-            return request_fn()
-        except Exception as e:
-            attempt += 1
-            status = getattr(e, "response", None)
-            status = getattr(status, "status_code", None)
-
-            retriable = (
-                isinstance(e, requests.Timeout) or 
-                status in {429, 500, 502, 503, 504}
-            )
-
-            if attempt >= max_attempts or not retriable:
-                raise
-
-            if status == 429:
-                sleep_s = min(max_delay, base_delay * (2 ** (attempt - 1)) * 2)
-            else:
-                sleep_s = min(max_delay, base_delay * (2 ** (attempt - 1)))
-
-            sleep_s *= (0.5 + random.random())
-            logging.warning(f"[RETRY] {attempt}/{max_attempts}. Retrying in {sleep_s:.2f}s…")
-            time.sleep(sleep_s)
+# 429/5xx come back as responses (httpx doesn't raise on them), so they are
+# retried on the result; 529 is the "overloaded" status some gateways use
+RETRY_STATUSES = {429, 500, 502, 503, 504, 529}
+
+
+def _log_retry(state):
+    logging.warning(f"[RETRY] {state.attempt_number}. Retrying in {state.next_action.sleep:.2f}s…")
+
+
+async def with_retries(request_fn, max_attempts=5, max_delay=30.0):
+    retrying = AsyncRetrying(
+        stop=stop_after_attempt(max_attempts),
+        wait=wait_random_exponential(multiplier=1, max=max_delay),
+        retry=(
+            retry_if_exception_type(httpx.TransportError)
+            | retry_if_result(lambda r: r.status_code in RETRY_STATUSES)
+        ),
+        before_sleep=_log_retry,
+        # Out of attempts: hand back the last response, or re-raise the last error
+        retry_error_callback=lambda state: state.outcome.result(),
+    )
+    return await retrying(request_fn)
 
 # =========================================================
 # 🔍 Text Normalization & Grouping
 # =========================================================
+_RE_PUNCT = re.compile(r"[^\wáéíóúñ ]")
+
 def normalize_text(s):
     if not isinstance(s, str):
         return ""
-    s = s.lower()
-    s = re.sub(r"\s+", " ", s)
-    s = re.sub(r"[^\wáéíóúñ ]", "", s)
+    return _normalize_str(s)
+
+@lru_cache(maxsize=8192)
+def _normalize_str(s):
+    # Event streams repeat the same messages, so each distinct text is normalized once
+    # split()/join() collapses whitespace runs in C, cheaper than a regex pass
+    s = " ".join(s.lower().split())
+    s = _RE_PUNCT.sub("", s)
     return s.strip()
 
 def similarity(a, b):
-    return SequenceMatcher(None, a, b).ratio()
+    return fuzz.ratio(a, b) / 100.0
 
 def group_similar_events(events, threshold=0.95):
     if not events:
         return []
 
     groups = []
+    # Group leaders sorted by norm length, so each event is only scored against
+    # leaders whose length can still reach the threshold:
+    # |la - lb| <= (1 - t) * (la + lb)  =>  la * t / (2 - t) <= lb <= la * (2 - t) / t
+    lengths = []
+    norms = []
+    group_ids = []
+    # Exact normalized text -> group it leads; an identical leader always scores
+    # 100, so repeats skip the fuzzy scan without changing the result
+    leader_of = {}
     for evt in events:
         text = evt.get("text", "") or evt.get("msg", "") or ""
         norm = normalize_text(text)
-
-        matched = False
-        for g in groups:
-            if similarity(g["norm"], norm) >= threshold:
-                g["count"] += 1
-                # Update last timestamp if this event is newer
-                if evt["timestamp"] > g["timestamp_last"]:
-                    g["timestamp_last"] = evt["timestamp"]
-                # Update first timestamp if this event is older (though usually sorted)
-                if evt["timestamp"] < g["timestamp_first"]:
-                    g["timestamp_first"] = evt["timestamp"]
-                
-                matched = True
-                break
-
-        if not matched:
+        # Rows pre-counted by fetch_event_counts carry their own count/range
+        count = evt.get("count", 1)
+        ts_first = evt.get("timestamp_first") or evt["timestamp"]
+        ts_last = evt.get("timestamp_last") or evt["timestamp"]
+
+        gid = leader_of.get(norm)
+        if gid is not None:
+            g = groups[gid]
+            g["count"] += count
+            if ts_last > g["timestamp_last"]:
+                g["timestamp_last"] = ts_last
+            if ts_first < g["timestamp_first"]:
+                g["timestamp_first"] = ts_first
+            continue
+
+        la = len(norm)
+        lo = bisect_left(lengths, int(la * threshold / (2 - threshold)))
+        hi = len(lengths)
+        if threshold > 0:
+            hi = bisect_right(lengths, int(la * (2 - threshold) / threshold) + 1)
+
+        # Score the length window in one C-level scan, keeping the best match
+        match = process.extractOne(
+            norm, norms[lo:hi], scorer=fuzz.ratio, score_cutoff=threshold * 100
+        )
+
+        if match is not None:
+            g = groups[group_ids[lo + match[2]]]
+            g["count"] += count
+            # Update last timestamp if this event is newer
+            if ts_last > g["timestamp_last"]:
+                g["timestamp_last"] = ts_last
+            # Update first timestamp if this event is older (though usually sorted)
+            if ts_first < g["timestamp_first"]:
+                g["timestamp_first"] = ts_first
+        else:
+            pos = bisect_right(lengths, la)
+            lengths.insert(pos, la)
+            norms.insert(pos, norm)
+            group_ids.insert(pos, len(groups))
+            leader_of[norm] = len(groups)
             groups.append({
                 "sample_text": text,
                 "norm": norm,
-                "count": 1,
-                "timestamp_first": evt["timestamp"],
-                "timestamp_last": evt["timestamp"],
+                "count": count,
+                "timestamp_first": ts_first,
+                "timestamp_last": ts_last,
             })
 
     # Clean up internal 'norm' key before returning
@@ -165,61 +233,87 @@ def group_similar_events(events, threshold=0.95):
 # =========================================================
 # 🗂 Read Mongo Events
 # =========================================================
-def fetch_events(start_str=None, end_str=None):
+async def fetch_event_counts(start_str=None, end_str=None):
     # Default to last 1 hour if nothing provided
     if not start_str:
         start_dt = datetime.now(timezone.utc) - timedelta(hours=1)
     else:
         try:
-            start_dt = datetime.fromisoformat(start_str.replace("Z", "+00:00"))
+            start_dt = ciso8601.parse_datetime(start_str)
         except:
              start_dt = datetime.now(timezone.utc) - timedelta(hours=1)
 
-    # Ensure we use datetime objects for query if DB has datetime, or strings if DB has strings
-    query_parts = []
-    
-    # 1. Datetime object query
-    query_parts.append({"timestamp": {"$gte": start_dt}})
-    
-    # 2. String query (ISO)
-    query_parts.append({"timestamp": {"$gte": start_dt.isoformat()}})
-    
-    query = {"$or": query_parts}
-    
+    # Timestamps are stored as BSON dates, so a single range hits the index
+    ts_range = {"$gte": start_dt}
+
     # If end time provided
     if end_str:
         try:
-            end_dt = datetime.fromisoformat(end_str.replace("Z", "+00:00"))
-            # Update the $or parts to include the $lte constraint
-            range_dt = {"timestamp": {"$gte": start_dt, "$lte": end_dt}}
-            range_str = {"timestamp": {"$gte": start_dt.isoformat(), "$lte": end_dt.isoformat()}}
-            
-            query = {"$or": [range_dt, range_str]}
+            ts_range["$lte"] = ciso8601.parse_datetime(end_str)
         except:
             pass
 
-    # Sort descending (newest first) for better dashboard experience
-    docs = col.find(query).sort("timestamp", -1)
+    query = {"timestamp": ts_range}
+
+    # Collapse exact-duplicate texts server-side; fuzzy grouping then only runs
+    # over the distinct texts. Newest first for better dashboard experience.
+    pipeline = [
+        {"$match": query},
+        {
+            "$group": {
+                # Same as `doc.get("text") or doc.get("msg") or ""`: an empty text
+                # falls back to msg ($ifNull turns a missing field into null first)
+                "_id": {
+                    "$cond": [
+                        {"$in": [{"$ifNull": ["$text", None]}, [None, ""]]},
+                        {"$cond": [{"$in": [{"$ifNull": ["$msg", None]}, [None, ""]]}, "", "$msg"]},
+                        "$text",
+                    ]
+                },
+                "count": {"$sum": 1},
+                "timestamp_first": {"$min": "$timestamp"},
+                "timestamp_last": {"$max": "$timestamp"},
+            }
+        },
+        {"$sort": {"timestamp_last": -1}},
+    ]
 
     events = []
-    for doc in docs:
-        ts = doc.get("timestamp")
-        # Ensure standard ISO format in memory
-        if isinstance(ts, datetime):
-             if ts.tzinfo is None:
-                 ts = ts.replace(tzinfo=timezone.utc)
-             ts = ts.isoformat()
-        
-        doc["timestamp"] = ts
-        doc.pop("_id", None)
-        events.append(doc)
+    # Only hint an index known to exist; a missing hinted index fails the query
+    hint = [("timestamp", -1)] if _timestamp_indexed else None
+    async for doc in col.aggregate(pipeline, hint=hint):
+        events.append({
+            "text": doc["_id"],
+            "count": doc["count"],
+            "timestamp_first": to_iso(doc["timestamp_first"]),
+            "timestamp_last": to_iso(doc["timestamp_last"]),
+        })
 
     return events
 
 
+def to_iso(ts):
+    # Ensure standard ISO format in memory
+    if isinstance(ts, datetime):
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        ts = ts.isoformat()
+    return ts
+
+
 # =========================================================
 # 🧠 LLM ANALYSIS
 # =========================================================
+def truncate_long_strings(ev, max_len=150): # Reduced from 300 to 150
+    # Most events have no long fields; only copy the dict when one needs cutting
+    if not any(isinstance(v, str) and len(v) > max_len for v in ev.values()):
+        return ev
+    return {
+        k: v[:max_len] + "..." if isinstance(v, str) and len(v) > max_len else v
+        for k, v in ev.items()
+    }
+
+async def call_llm_analysis(events_list, question=None, model=None):
     chosen_model = model or OPENAI_MODEL
     
     # Optimize payload: 
@@ -235,15 +329,7 @@ def fetch_events(start_str=None, end_str=None):
         events_list = events_list[:MAX_EVENTS]
 
     # 2. Truncate long strings in events to save tokens
-    optimized_events = []
-    for ev in events_list:
-        clean_ev = {}
-        for k, v in ev.items():
-            if isinstance(v, str) and len(v) > 150: # Reduced from 300 to 150
-                clean_ev[k] = v[:150] + "..."
-            else:
-                clean_ev[k] = v
-        optimized_events.append(clean_ev)
+    optimized_events = [truncate_long_strings(ev) for ev in events_list]
 
     # Prepare payload. 
     payload = {
@@ -261,30 +347,36 @@ def fetch_events(start_str=None, end_str=None):
     chosen_model = model or OPENAI_MODEL
     logging.info(f"Analyzing {len(events_list)} items... Question: {question} Model: {chosen_model}")
 
-    headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
+    # Serialized once; the debug log below reuses the same string
+    try:
+        user_content = orjson.dumps(payload).decode()
+    except TypeError:
+        # Client events are arbitrary JSON; orjson rejects ints wider than 64 bits
+        user_content = json.dumps(payload, ensure_ascii=False)
+    logging.debug("LLM payload: %s", user_content)
 
     req_body = {
         "model": chosen_model,
         "messages": [
-            {"role": "system", "content": "You are an expert monitoring system. Respond in valid JSON."},
-            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)}
+            SYSTEM_MSG,
+            {"role": "user", "content": user_content}
         ],
         "temperature": 0.2,
         "response_format": {"type": "json_object"}
     }
 
     try:
-        def _r():
-            return requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=req_body, timeout=60)
+        async def _r():
+            return await _http.post("https://api.openai.com/v1/chat/completions", headers=OPENAI_HEADERS, content=orjson.dumps(req_body), timeout=60)
 
-        r = with_retries(_r)
+        r = await with_retries(_r)
         
-        if not r.ok:
+        if not r.is_success:
             logging.error(f"OpenAI API Error: {r.status_code} {r.text}")
             return {"score": 0.0, "text": f"API Error {r.status_code}: {r.text}"}
 
-        content = r.json()["choices"][0]["message"]["content"].strip()
-        logging.info(f"DEBUG: Raw LLM Response: {content}")
+        content = orjson.loads(r.content)["choices"][0]["message"]["content"].strip()
+        logging.debug("Raw LLM Response: %s", content)
         
         # Clean potential markdown code blocks ```json ... ```
         if content.startswith("```"):
@@ -295,7 +387,7 @@ def fetch_events(start_str=None, end_str=None):
                 pass 
             content = content.strip()
 
-        return json.loads(content)
+        return orjson.loads(content)
 
     except Exception as e:
         logging.error(f"Analysis error: {e}")
@@ -305,17 +397,17 @@ def fetch_events(start_str=None, end_str=None):
 # =========================================================
 # 🔔 Telegram
 # =========================================================
-def send_telegram_msg(msg):
+async def send_telegram_msg(msg):
     if not ENABLE_TELEGRAM:
         return False, "Telegram disabled in settings"
         
     url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
     data = {"chat_id": TELEGRAM_CHAT_ID, "text": msg}
     try:
-        def _r():
-            return requests.post(url, data=data, timeout=10)
-        r = with_retries(_r)
-        if r.ok:
+        async def _r():
+            return await _http.post(url, data=data, timeout=10)
+        r = await with_retries(_r)
+        if r.is_success:
             return True, "Sent"
         else:
             return False, f"Telegram API error: {r.text}"
@@ -328,20 +420,21 @@ def send_telegram_msg(msg):
 # =========================================================
 
 @app.get("/unique_events")
-def get_unique_events(start: Optional[str] = None, end: Optional[str] = None):
+async def get_unique_events(start: Optional[str] = None, end: Optional[str] = None):
     """
     Fetch events in range, group them by similarity, return groups.
     """
-    raw_events = fetch_events(start, end)
-    grouped = group_similar_events(raw_events)
-    return {"count_raw": len(raw_events), "count_unique": len(grouped), "groups": grouped}
+    distinct_events = await fetch_event_counts(start, end)
+    grouped = group_similar_events(distinct_events)
+    count_raw = sum(ev["count"] for ev in distinct_events)
+    return {"count_raw": count_raw, "count_unique": len(grouped), "groups": grouped}
 
 @app.post("/analyze", response_model=AnalysisResponse)
-def trigger_analysis(req: AnalysisRequest):
+async def trigger_analysis(req: AnalysisRequest):
     """
     Analyze the provided list of events (or groups).
     """
-    result = call_llm_analysis(req.events, question=req.question, model=req.model)
+    result = await call_llm_analysis(req.events, question=req.question, model=req.model)
     
     # --- Robust Adaptive Parsing ---
     score = result.get("score")
@@ -350,7 +443,7 @@ def trigger_analysis(req: AnalysisRequest):
     # Helper to clean text
     def clean(t):
         if isinstance(t, (dict, list)):
-            return json.dumps(t, ensure_ascii=False, indent=2)
+            return orjson.dumps(t, option=orjson.OPT_INDENT_2).decode()
         return str(t) if t else ""
 
     # 1. Try "analisis" wrapper
@@ -390,7 +483,7 @@ def trigger_analysis(req: AnalysisRequest):
 
     # 3. Fallback: Dump full JSON
     if not text:
-        text = json.dumps(result, ensure_ascii=False, indent=2)
+        text = orjson.dumps(result, option=orjson.OPT_INDENT_2).decode()
         
     # Final Score Default
     if score is None:
@@ -409,17 +502,17 @@ def trigger_analysis(req: AnalysisRequest):
     )
 
 @app.post("/telegram")
-def trigger_telegram(req: TelegramRequest):
+async def trigger_telegram(req: TelegramRequest):
     """
     Send text to Telegram manually.
     """
-    success, reason = send_telegram_msg(req.text)
+    success, reason = await send_telegram_msg(req.text)
     if not success:
         raise HTTPException(status_code=500, detail=reason)
     return {"status": "ok", "detail": reason}
 
 @app.post("/export_rag")
-def export_rag(req: AnalysisRequest):
+async def export_rag(req: AnalysisRequest):
     """
     Generate a Markdown formatted string of events suitable for RAG.
     """
@@ -451,4 +544,12 @@ def export_rag(req: AnalysisRequest):
     return {"markdown": md_output}
 
 if __name__ == "__main__":
-    uvicorn.run("consumer:app", host="0.0.0.0", port=8002, reload=False)
+    uvicorn.run(
+        "consumer:app",
+        host="0.0.0.0",
+        port=8002,
+        reload=False,
+        loop="uvloop",
+        http="httptools",
+        workers=os.cpu_count(),
+    )
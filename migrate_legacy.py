@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# migrate_legacy.py — One-shot migration of legacy documents to the current storage format.
+# The API now stores timestamps as BSON dates and sources lowercased; run this
+# once so older documents match the same range/prefix queries and indexes,
+# and to drop the single-field indexes the compound ones replace.
+
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from app.config import settings
+
+
+def migrate_timestamps(coll):
+    # Unparseable strings are left untouched instead of aborting the update
+    pipeline = [
+        {
+            "$set": {
+                "timestamp": {
+                    "$convert": {"input": "$timestamp", "to": "date", "onError": "$timestamp"}
+                }
+            }
+        }
+    ]
+    result = coll.update_many({"timestamp": {"$type": "string"}}, pipeline)
+    remaining = coll.count_documents({"timestamp": {"$type": "string"}})
+    print(f"✅ {coll.name}: converted {result.modified_count} timestamps ({remaining} unparseable left)")
+
+
+def migrate_sources(coll):
+    pipeline = [{"$set": {"source": {"$toLower": "$source"}}}]
+    result = coll.update_many({"source": {"$type": "string", "$regex": "[A-Z]"}}, pipeline)
+    print(f"✅ {coll.name}: lowercased {result.modified_count} sources")
+
+
+def drop_legacy_indexes(coll):
+    # Superseded by {timestamp: -1}, {source: 1, timestamp: -1} and the text index
+    existing = coll.index_information()
+    for name in ("timestamp_1", "source_1", "text_1"):
+        if name in existing:
+            coll.drop_index(name)
+            print(f"✅ {coll.name}: dropped index {name}")
+
+
+def main():
+    client = MongoClient(settings.MONGO_URI)
+    db = client[settings.MONGO_DB_NAME]
+    try:
+        # victoria_history is written by the external Victoria executor, which
+        # may keep storing ISO strings and mixed-case sources; its queries
+        # handle both instead, so only its indexes are cleaned up
+        migrate_timestamps(db[settings.MONGO_COLL_NAME])
+        migrate_sources(db[settings.MONGO_COLL_NAME])
+        for name in (settings.MONGO_COLL_NAME, settings.MONGO_COLL_VICTORIA):
+            drop_legacy_indexes(db[name])
+    except PyMongoError as e:
+        print(f"⚠ Migration failed: {e}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,14 +3,20 @@
 # Refactored: Analysis logic moved to Victoria. This server only stores events.
 
 import os
+import re
+import time
 import datetime as dt
-from typing import Optional
+from typing import List, Optional
+import ciso8601
+import orjson
 from fastapi import FastAPI, Query, Header, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from pymongo import MongoClient
-from pymongo.errors import PyMongoError
+from contextlib import asynccontextmanager
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError, PyMongoError
 
 load_dotenv()
 
@@ -21,22 +27,28 @@ MONGO_COLL_NAME = os.getenv("MONGO_COLL_NAME", "events")
 API_TOKEN = os.getenv("API_TOKEN")  # Optional API key for write/query endpoints
 
 # ===== MongoDB Setup =====
-client = MongoClient(MONGO_URI)
+client = AsyncIOMotorClient(MONGO_URI, maxPoolSize=100, tz_aware=True)
 db = client[MONGO_DB_NAME]
 coll = db[MONGO_COLL_NAME]
 
-def ensure_indexes():
+async def ensure_indexes():
     try:
-        coll.create_index("timestamp")
-        coll.create_index("source")
-        coll.create_index("text")
+        # Timestamps are BSON dates; newest-first lists read straight off these
+        await coll.create_index([("timestamp", -1)])
+        await coll.create_index([("source", 1), ("timestamp", -1)])
+        # Same spec/name as app.database so both services can share the collection
+        await coll.create_index([("text", "text"), ("description", "text")], name="events_text_idx")
     except PyMongoError as e:
         print(f"⚠ Error creating indexes: {e}")
 
-ensure_indexes()
-
 # ===== App =====
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await ensure_indexes()
+    yield
+    client.close()
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -54,7 +66,7 @@ class Event(BaseModel):
     timestamp: Optional[str] = None  # ISO8601 string
 
 
-def require_api_key(x_api_key: Optional[str] = Header(None)):
+async def require_api_key(x_api_key: Optional[str] = Header(None)):
     if API_TOKEN and x_api_key != API_TOKEN:
         raise HTTPException(status_code=401, detail="Invalid API token")
     return True
@@ -70,21 +82,13 @@ def to_datetime(value) -> Optional[dt.datetime]:
             return value.replace(tzinfo=dt.timezone.utc)
         return value.astimezone(dt.timezone.utc)
     if isinstance(value, str):
-        try:
-            parsed = dt.datetime.fromisoformat(value.replace("Z", "+00:00"))
-            if parsed.tzinfo is None:
-                parsed = parsed.replace(tzinfo=dt.timezone.utc)
-            else:
-                parsed = parsed.astimezone(dt.timezone.utc)
-            return parsed
-        except Exception:
-            return None
+        return parse_iso_dt(value)
     return None
 
 def parse_iso_dt(value: str) -> Optional[dt.datetime]:
     """Parses flexible ISO8601 dates and returns normalized UTC datetime."""
     try:
-        parsed = dt.datetime.fromisoformat(value.replace("Z", "+00:00"))
+        parsed = ciso8601.parse_datetime(value)
         if parsed.tzinfo is None:
             parsed = parsed.replace(tzinfo=dt.timezone.utc)
         else:
@@ -94,24 +98,20 @@ def parse_iso_dt(value: str) -> Optional[dt.datetime]:
         return None
 
 def serialize_event(doc: dict) -> dict:
-    data = dict(doc)
-    if "_id" in data:
-        data["_id"] = str(data["_id"])
-    ts = data.get("timestamp")
-    if isinstance(ts, dt.datetime):
-        data["timestamp"] = ts.astimezone(dt.timezone.utc).isoformat()
-    return data
-
-def save_event(ev: dict):
-    ts = to_datetime(ev.get("timestamp"))
-    if ts:
-        ev["timestamp"] = ts
+    # Timestamps are UTC-aware dates the response class encodes as-is
+    if "_id" in doc:
+        doc["_id"] = str(doc["_id"])
+    return doc
+
+async def save_event(ev: dict):
+    # Never store a raw string: range queries only match BSON dates
+    ev["timestamp"] = to_datetime(ev.get("timestamp")) or dt.datetime.now(dt.timezone.utc)
     try:
-        coll.insert_one(ev)
+        await coll.insert_one(ev)
     except PyMongoError as e:
         print(f"⚠ Error saving event: {e}")
 
-def query_collection(
+async def query_collection(
     target_coll,
     start: Optional[str],
     end: Optional[str],
@@ -120,40 +120,27 @@ def query_collection(
     limit: int,
 ):
     filters = []
-    ts_filters = []
-    ts_range_dt = {}
-    ts_range_str = {}
+    ts_range = {}
     if start:
         start_dt = parse_iso_dt(start)
         if not start_dt:
             return {"count": 0, "items": [], "error": "invalid start (ISO8601)"}
-        ts_range_dt["$gte"] = start_dt
-        ts_range_str["$gte"] = start_dt.isoformat()
+        ts_range["$gte"] = start_dt
     if end:
         end_dt = parse_iso_dt(end)
         if not end_dt:
             return {"count": 0, "items": [], "error": "invalid end (ISO8601)"}
-        ts_range_dt["$lte"] = end_dt
-        ts_range_str["$lte"] = end_dt.isoformat()
-    if ts_range_dt:
-        ts_filters.append({"timestamp": ts_range_dt})
-    if ts_range_str:
-        ts_filters.append({"timestamp": ts_range_str})
-    if ts_filters:
-        filters.append({"$or": ts_filters} if len(ts_filters) > 1 else ts_filters[0])
+        ts_range["$lte"] = end_dt
+    if ts_range:
+        # Timestamps are BSON dates (see migrate_legacy.py for older string rows)
+        filters.append({"timestamp": ts_range})
 
     if source:
-        filters.append({"source": {"$regex": source, "$options": "i"}})
+        # Anchored prefix on the lowercased field can use the source index
+        filters.append({"source": {"$regex": f"^{re.escape(source.lower())}"}})
 
     if text:
-        filters.append(
-            {
-                "$or": [
-                    {"text": {"$regex": text, "$options": "i"}},
-                    {"description": {"$regex": text, "$options": "i"}},
-                ]
-            }
-        )
+        filters.append({"$text": {"$search": text}})
 
     if not filters:
         mongo_filter = {}
@@ -165,29 +152,81 @@ def query_collection(
     try:
         events = [
             serialize_event(e)
-            for e in target_coll.find(mongo_filter, sort=[("timestamp", -1)]).limit(limit)
+            async for e in target_coll.find(mongo_filter, sort=[("timestamp", -1)]).limit(limit)
         ]
         return {"count": len(events), "items": events, "applied_filter": mongo_filter}
     except PyMongoError as e:
         return {"count": 0, "items": [], "error": str(e), "applied_filter": mongo_filter}
 
 # ===== Endpoints =====
+# Load balancers probe /health constantly; rebuild the body at most every 250ms
+_health_body = b""
+_health_until = 0.0
+
 @app.get("/health")
-def health():
-    return {"ok": True, "ts": now_iso()}
+async def health():
+    global _health_body, _health_until
+    now = time.monotonic()
+    if now >= _health_until:
+        _health_body = orjson.dumps({"ok": True, "ts": now_iso()})
+        _health_until = now + 0.25
+    return Response(_health_body, media_type="application/json")
+
+def event_doc(ev: Event) -> Optional[dict]:
+    """Storage document for an event, or None if its timestamp is not ISO8601."""
+    data = ev.model_dump()  # Pydantic v2 (Rust core)
+    data["source"] = data["source"].lower()
+    # Always store a BSON date so range queries hit a single index type; a
+    # missing timestamp means "now", an unparseable one is rejected rather
+    # than re-dated into the current analysis window
+    if data.get("timestamp") is None:
+        data["timestamp"] = dt.datetime.now(dt.timezone.utc)
+    else:
+        data["timestamp"] = to_datetime(data["timestamp"])
+        if not data["timestamp"]:
+            return None
+    return data
+
+def bulk_event_docs(evs: List[Event]):
+    """Documents for the valid events, plus the list indexes of rejected ones."""
+    docs, rejected = [], []
+    for i, ev in enumerate(evs):
+        data = event_doc(ev)
+        if data is None:
+            rejected.append(i)
+        else:
+            docs.append(data)
+    return docs, rejected
+
+def valid_event_doc(ev: Event) -> dict:
+    data = event_doc(ev)
+    if data is None:
+        raise HTTPException(status_code=422, detail=f"invalid timestamp (ISO8601): {ev.timestamp}")
+    return data
 
 @app.post("/event")
-def add_event(ev: Event, _: bool = Depends(require_api_key)):
-    data = ev.dict()
-    ts = to_datetime(data.get("timestamp"))
-    if not ts:
-        ts = dt.datetime.now(dt.timezone.utc)
-    data["timestamp"] = ts
-    save_event(data)
+async def add_event(ev: Event, _: bool = Depends(require_api_key)):
+    await save_event(valid_event_doc(ev))
     return {"status": "stored"}
 
+@app.post("/events:bulk")
+async def add_events(evs: List[Event], _: bool = Depends(require_api_key)):
+    docs, rejected = bulk_event_docs(evs)
+    if not docs:
+        return {"status": "partial" if rejected else "stored", "count": 0, "rejected": rejected}
+    try:
+        # Unordered: one round trip, and a bad document doesn't stop the rest
+        res = await coll.insert_many(docs, ordered=False)
+        return {"status": "partial" if rejected else "stored", "count": len(res.inserted_ids), "rejected": rejected}
+    except BulkWriteError as e:
+        print(f"⚠ Error saving events: {e}")
+        return {"status": "partial", "count": e.details.get("nInserted", 0), "rejected": rejected, "message": str(e)}
+    except PyMongoError as e:
+        print(f"⚠ Error saving events: {e}")
+        return {"status": "error", "message": str(e)}
+
 @app.get("/events")
-def list_events(
+async def list_events(
     _: bool = Depends(require_api_key),
     start: Optional[str] = None,
     end: Optional[str] = None,
@@ -195,10 +234,18 @@ def list_events(
     text: Optional[str] = None,
     limit: int = Query(200, ge=1, le=1000),
 ):
-    return query_collection(coll, start, end, source, text, limit)
+    return await query_collection(coll, start, end, source, text, limit)
 
 
 # ===== Main =====
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("server:app", host="0.0.0.0", port=8001, reload=False)
+    uvicorn.run(
+        "server:app",
+        host="0.0.0.0",
+        port=8001,
+        reload=False,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+    )